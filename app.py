@@ -1,36 +1,142 @@
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import polars as pl
 import dash
 from dash import html, dcc, Input, Output
-import plotly.express as px
+import plotly.graph_objects as go
+from flask_caching import Cache
 
 # === Load Excel Data ===
-df = pd.read_excel(
-    "WRLG_KPI_Daily_Reporting.xlsx",
-    sheet_name="KPI 2024 Dump",
-    engine="openpyxl",
-    header=0
-)
+EXCEL_PATH = Path("WRLG_KPI_Daily_Reporting.xlsx")
+CACHE_PATH = EXCEL_PATH.with_suffix(".parquet")
+SHEET_NAME = "KPI 2024 Dump"
+KPI_COLS = [
+    "Total Hauled Tonnes", "Total Ore Hauled Tonnes",
+    "Total Waste Hauled Tonnes", "Equivalent Advance (m)"
+]
+SOURCE_COLS = ["Year", "Month", "Day"] + KPI_COLS
+
+
+def read_sheet():
+    try:
+        return pd.read_excel(
+            EXCEL_PATH,
+            sheet_name=SHEET_NAME,
+            engine="calamine",
+            usecols=SOURCE_COLS,
+            header=0
+        )
+    except Exception:
+        # calamine rejects some workbooks; xlsx2csv is slower but more lenient.
+        return pl.read_excel(
+            EXCEL_PATH,
+            sheet_name=SHEET_NAME,
+            engine="xlsx2csv",
+            columns=SOURCE_COLS,
+            schema_overrides={c: pl.Float64 for c in KPI_COLS},
+            read_options={"null_values": ["#N/A"]}
+        ).to_pandas()
+
+
+def load_lf():
+    # Parse the workbook only when the Parquet cache is missing or stale.
+    # Only the columns the dashboard uses are kept: the free-text columns in
+    # the dump mix ints and strings and can't be written to Parquet.
+    # A cache we can't open (e.g. written by another user) means a re-parse.
+    if CACHE_PATH.exists() and CACHE_PATH.stat().st_mtime >= EXCEL_PATH.stat().st_mtime:
+        try:
+            with open(CACHE_PATH, "rb") as f:
+                return pl.read_parquet(f).lazy()
+        except OSError:
+            pass
+
+    # Write to a temp file and rename it into place, so another worker never
+    # scans a half-written cache. If the directory isn't writable, run from
+    # the freshly parsed frame instead.
+    df = read_sheet()
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=CACHE_PATH.parent, prefix=f"{CACHE_PATH.name}.", suffix=".tmp"
+        )
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        # mkstemp creates the file as 0600; give the cache the permissions a
+        # plain write would have had, so other users can read it.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return pl.from_pandas(df).lazy()
+    return pl.scan_parquet(CACHE_PATH)
+
 
 # === Format Dates ===
-month_map = {
-    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
-    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
-}
-df["Month"] = df["Month"].map(month_map)
-df["Date"] = pd.to_datetime(df[["Year", "Month", "Day"]])
-df["MonthStart"] = df["Date"].values.astype("datetime64[M]")
-df["MonthYear"] = df["Date"].dt.strftime("%b %Y")
+month_abbrs = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+    "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
+]
+lf = load_lf().with_columns(
+    pl.col(KPI_COLS).cast(pl.Float32),
+    Date=pl.date(
+        "Year", pl.col("Month").cast(pl.Enum(month_abbrs)).to_physical() + 1, "Day"
+    )
+)
+
+# === Daily Aggregates ===
+# The dump has one row per shift entry; every view works on per-day totals,
+# so sum them once here instead of on every callback. group_by runs in
+# parallel and doesn't keep order, hence the sort.
+daily_df = (
+    lf.group_by("Date")
+    .agg(pl.col(KPI_COLS).sum())
+    .sort("Date")
+    .with_columns(
+        MonthYear=pl.col("Date").dt.strftime("%b %Y"),
+        MonthStart=pl.col("Date").dt.truncate("1mo")
+    )
+    .collect()
+    .to_pandas()
+)
 
 # === Dropdown Options ===
-month_lookup = df[["MonthYear", "MonthStart"]].drop_duplicates().sort_values("MonthStart")
+month_lookup = daily_df[["MonthYear", "MonthStart"]].drop_duplicates().sort_values("MonthStart")
 month_year_options = month_lookup["MonthYear"].tolist()
 material_options = ["Ore", "Waste"]
 
+# === Month Index ===
+# Ordered so sort_index() keeps months chronological; daily_df is already in
+# Date order, and the stable sort preserves it within each month.
+daily_df["MonthYear"] = pd.Categorical(
+    daily_df["MonthYear"], categories=month_year_options, ordered=True
+)
+# MonthStart only orders the dropdown; leave it out so each selection slices
+# just Date and the KPI columns.
+daily_by_month = (
+    daily_df.drop(columns="MonthStart")
+    .set_index("MonthYear")
+    .sort_index(kind="stable")
+)
+month_codes = daily_by_month.index.codes
+code_of = {m: i for i, m in enumerate(month_year_options)}
+ALL_MONTHS = frozenset(month_year_options)
+
 # === Dash App ===
 app = dash.Dash(__name__)
 server = app.server
+cache = Cache(server, config={"CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 3600})
 
 # === Layout ===
+# The KPI headings are static; the callback only fills in their text.
+KPI_IDS = ["kpi-total-haul", "kpi-ore", "kpi-waste", "kpi-advance"]
+
 app.layout = html.Div([
     html.H1("Underground Mining KPI Dashboard", style={"textAlign": "center"}),
 
@@ -44,75 +150,136 @@ app.layout = html.Div([
         ),
     ], style={"width": "40%", "margin": "auto"}),
 
-    html.Div(id="kpi-output"),
+    html.Div([html.H3(id=kpi_id) for kpi_id in KPI_IDS], id="kpi-output"),
     html.Div(id="charts-output")
 ])
 
-# === Callback ===
-@app.callback(
-    [Output("kpi-output", "children"), Output("charts-output", "children")],
-    [Input("month-filter", "value")]
-)
-def update_dashboard(selected_months):
-    filtered = df[df["MonthYear"].isin(selected_months)]
+# === Figures ===
+def bar_layout(title, x_title, y_title, legend_title):
+    return go.Layout(
+        title={"text": title},
+        xaxis={"title": {"text": x_title}},
+        yaxis={"title": {"text": y_title}},
+        legend={"title": {"text": legend_title}},
+        barmode="relative"
+    )
+
+
+def month_bar(month, x, y, y_title):
+    # showlegend is forced as px.bar does; plotly.js hides the legend of a
+    # single-trace figure otherwise.
+    return go.Bar(
+        x=x, y=np.asarray(y), name=month,
+        legendgroup=month, showlegend=True,
+        hovertemplate=f"MonthYear={month}<br>Date=%{{x}}<br>{y_title}=%{{y}}<extra></extra>"
+    )
+
+
+@cache.memoize()
+def build_figures(months):
+    # months is a sorted tuple so equal selections share a cache entry. The
+    # figures are cached as plain JSON dicts, which skips rebuilding and
+    # re-serialising the Figure objects on a hit.
+
+    # A mask over the category codes keeps the index order, so the slice
+    # stays chronological however the months were picked. Selecting every
+    # month needs no mask at all.
+    if frozenset(months) == ALL_MONTHS:
+        filtered = daily_by_month.reset_index()
+    else:
+        sel = np.fromiter((code_of[m] for m in months), dtype=month_codes.dtype, count=len(months))
+        filtered = daily_by_month[np.isin(month_codes, sel)].reset_index()
 
     # KPIs
-    total_haul = filtered["Total Hauled Tonnes"].sum()
-    ore = filtered["Total Ore Hauled Tonnes"].sum()
-    waste = filtered["Total Waste Hauled Tonnes"].sum()
-    advance = filtered["Equivalent Advance (m)"].sum()
-
-    kpis = html.Div([
-        html.H3(f"Total Hauled: {total_haul:.0f} tonnes"),
-        html.H3(f"Ore Hauled: {ore:.0f} tonnes"),
-        html.H3(f"Waste Hauled: {waste:.0f} tonnes"),
-        html.H3(f"Meters Advanced: {advance:.2f} m")
-    ])
+    total_haul, ore, waste, advance = filtered[KPI_COLS].to_numpy().sum(axis=0)
 
-    # Charts
-    haul_chart = px.bar(
-        filtered.groupby("Date")["Total Hauled Tonnes"].sum().reset_index(),
-        x="Date", y="Total Hauled Tonnes", title="Total Hauled Tonnes Per Day",
-        color=filtered["MonthYear"]
+    kpis = (
+        f"Total Hauled: {total_haul:.0f} tonnes",
+        f"Ore Hauled: {ore:.0f} tonnes",
+        f"Waste Hauled: {waste:.0f} tonnes",
+        f"Meters Advanced: {advance:.2f} m"
     )
 
-    ore_vs_waste = filtered.groupby("Date")[
-        ["Total Ore Hauled Tonnes", "Total Waste Hauled Tonnes"]
-    ].sum().reset_index()
+    # Charts
+    # Built from go.Bar on the aggregated arrays; px.bar would reshape the
+    # frame to long form for every chart. The layout mirrors what px.bar set.
+    by_month = [
+        (str(m), sub["Date"].to_numpy(), sub)
+        for m, sub in filtered.groupby("MonthYear", sort=False, observed=True)
+    ]
 
-    ore_waste_chart = px.bar(
-        ore_vs_waste, x="Date",
-        y=["Total Ore Hauled Tonnes", "Total Waste Hauled Tonnes"],
-        title="Ore vs Waste Hauled"
+    haul_chart = go.Figure(
+        [
+            month_bar(m, x, sub["Total Hauled Tonnes"], "Total Hauled Tonnes")
+            for m, x, sub in by_month
+        ],
+        bar_layout("Total Hauled Tonnes Per Day", "Date", "Total Hauled Tonnes", "MonthYear")
     )
 
-    advance_chart = px.bar(
-        filtered.groupby("Date")["Equivalent Advance (m)"].sum().reset_index(),
-        x="Date", y="Equivalent Advance (m)",
-        title="Meters Advanced Per Day",
-        color=filtered["MonthYear"]
+    dates = filtered["Date"].to_numpy()
+    ore_waste_chart = go.Figure(
+        [
+            go.Bar(
+                x=dates, y=filtered[col].to_numpy(), name=col,
+                legendgroup=col, showlegend=True,
+                hovertemplate=f"variable={col}<br>Date=%{{x}}<br>value=%{{y}}<extra></extra>"
+            )
+            for col in ("Total Ore Hauled Tonnes", "Total Waste Hauled Tonnes")
+        ],
+        bar_layout("Ore vs Waste Hauled", "Date", "value", "variable")
+    )
+
+    advance_chart = go.Figure(
+        [
+            month_bar(m, x, sub["Equivalent Advance (m)"], "Equivalent Advance (m)")
+            for m, x, sub in by_month
+        ],
+        bar_layout("Meters Advanced Per Day", "Date", "Equivalent Advance (m)", "MonthYear")
     )
 
     # Monthly Average Daily Meters Advanced
-    daily_avg_by_month = filtered.groupby("MonthYear").agg({
-        "Equivalent Advance (m)": "sum",
-        "Date": pd.Series.nunique
-    }).reset_index()
-    daily_avg_by_month["Average Daily Meters"] = daily_avg_by_month["Equivalent Advance (m)"] / daily_avg_by_month["Date"]
-
-    avg_chart = px.bar(
-        daily_avg_by_month,
-        x="MonthYear", y="Average Daily Meters",
-        title="Average Daily Meters Advanced per Month",
-        color="MonthYear"
+    # filtered has one row per day, so the row count per month is the day
+    # count. Months come out in first-appearance (chronological) order.
+    codes, uniques = pd.factorize(filtered["MonthYear"], sort=False)
+    sums = np.bincount(codes, weights=filtered["Equivalent Advance (m)"].to_numpy())
+    counts = np.bincount(codes)
+
+    avg_chart = go.Figure(
+        [
+            go.Bar(
+                x=[str(m)], y=[avg], name=str(m),
+                legendgroup=str(m), showlegend=True,
+                hovertemplate="MonthYear=%{x}<br>Average Daily Meters=%{y}<extra></extra>"
+            )
+            for m, avg in zip(uniques, sums / counts)
+        ],
+        bar_layout(
+            "Average Daily Meters Advanced per Month",
+            "MonthYear", "Average Daily Meters", "MonthYear"
+        )
     )
 
-    return kpis, html.Div([
-        dcc.Graph(figure=haul_chart),
-        dcc.Graph(figure=ore_waste_chart),
-        dcc.Graph(figure=advance_chart),
-        dcc.Graph(figure=avg_chart)
-    ])
+    charts = tuple(
+        fig.to_plotly_json()
+        for fig in (haul_chart, ore_waste_chart, advance_chart, avg_chart)
+    )
+    return kpis, charts
+
+# Every single-month view is built up front, so these never expire from the
+# cache, and the default (latest month) renders without any work.
+PRECOMPUTED = {(m,): build_figures.uncached((m,)) for m in month_year_options}
+
+# === Callback ===
+@app.callback(
+    [Output(kpi_id, "children") for kpi_id in KPI_IDS]
+    + [Output("charts-output", "children")],
+    [Input("month-filter", "value")]
+)
+def update_dashboard(selected_months):
+    # Unknown values would have no category code; drop them up front.
+    months = tuple(sorted(frozenset(selected_months or ()) & ALL_MONTHS))
+    kpis, charts = PRECOMPUTED.get(months) or build_figures(months)
+    return (*kpis, html.Div([dcc.Graph(figure=chart) for chart in charts]))
 
 # === Run App ===
 if __name__ == '__main__':